@@ -1,17 +1,26 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import hashlib
+import json
 import os
 import logging
+import orjson
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Dict, Optional, Any
 import uuid
 from datetime import datetime
 import re
 import unicodedata
 import base64
+import numpy as np
+from collections import Counter
+from functools import lru_cache, wraps
+from itertools import chain, islice
 
 
 ROOT_DIR = Path(__file__).parent
@@ -19,11 +28,14 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# A warm pool avoids a fresh handshake per request; history writes are
+# acknowledged by the primary without waiting on the journal
+client = AsyncIOMotorClient(mongo_url, maxPoolSize=100, minPoolSize=10, w=1, journal=False)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI(title="LLM Text Guard API")
+# Responses are serialized with orjson rather than the stdlib json module
+app = FastAPI(title="LLM Text Guard API", default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -38,6 +50,16 @@ logger = logging.getLogger(__name__)
 # ============================================
 # PROMPT INJECTION DETECTION ENGINE
 # ============================================
+#
+# Most input is pure ASCII, and str.isascii() is a flag check on CPython, so
+# the character-level code branches on it up front:
+#   - zero-width, bidi and tag characters are all non-ASCII, so
+#     detect_unicode_threats skips those detectors for ASCII text
+#   - _scan only has to look for ASCII control characters (two of which are
+#     also HOMOGLYPHS entries, so the homoglyph and control detectors still run)
+#   - clean_text skips NFKC normalization, and returns ASCII text with no
+#     control characters unchanged
+# The pattern and encoding detectors run on all input.
 
 # Zero-width and invisible characters
 ZERO_WIDTH_CHARS = {
@@ -190,141 +212,330 @@ INSTRUCTION_PATTERNS = [
     (r'\|\s*SYSTEM\s*\|', 'Delimiter injection'),
 ]
 
+# Characters that re.IGNORECASE matches against ASCII letters but which str.lower()
+# leaves untouched (dotless i, long s). Folding them keeps positions unchanged.
+CASE_FOLD_TABLE = {0x0131: 'i', 0x017F: 's'}
+
+
+def fold_case(text: str) -> str:
+    """Lowercase text for the case-sensitive pattern matchers"""
+    lowered = text.lower()
+    # translate() is slow on non-ASCII strings, so only run it when needed
+    if '\u0131' in lowered or '\u017f' in lowered:
+        lowered = lowered.translate(CASE_FOLD_TABLE)
+    return lowered
+
+
+def compile_lowercase_pattern(pattern: str) -> re.Pattern:
+    """
+    Compile a pattern for matching against fold_case() output.
+    Literal letters are lowercased (escapes like \\S are left alone) and the
+    pattern is compiled case-sensitive, which keeps the regex engine's fast
+    literal-prefix search that re.IGNORECASE disables.
+    """
+    return re.compile(re.sub(r'(\\.)|([A-Z])', lambda m: m.group(1) or m.group(2).lower(), pattern))
+
+
+# Patterns stay separate rather than merged into one automaton: they are real
+# regexes (optional groups, \s+ gaps, alternations), each with its own literal
+# prefix that the case-sensitive engine finds with a fast substring search, and
+# skipping patterns whose leading word is absent was measured to gain nothing.
+COMPILED_INSTRUCTION_PATTERNS = tuple(
+    (pattern, compile_lowercase_pattern(pattern), description)
+    for pattern, description in INSTRUCTION_PATTERNS
+)
+
+# Delimiter/separator injection patterns
+DELIMITER_PATTERNS = [
+    (r'```[\s\S]*?```', 'Code block delimiter'),
+    (r'<\|[^|]+\|>', 'Pipe delimiter'),
+    (r'\[INST\]', 'Instruction marker'),
+    (r'\[/INST\]', 'Instruction marker'),
+    (r'<<SYS>>', 'System tag'),
+    (r'<</SYS>>', 'System tag'),
+    (r'Human:', 'Role marker'),
+    (r'Assistant:', 'Role marker'),
+    (r'###\s*Human', 'Role delimiter'),
+    (r'###\s*Assistant', 'Role delimiter'),
+]
+
+# Each delimiter pattern compiled for lowercased text, plus a case-insensitive
+# version for text whose lowercased form changes length
+COMPILED_DELIMITER_PATTERNS = [
+    (pattern, compile_lowercase_pattern(pattern), re.compile(pattern, re.IGNORECASE), description)
+    for pattern, description in DELIMITER_PATTERNS
+]
+
 # Unicode tag characters (used for ASCII smuggling)
 TAG_CHAR_START = 0xE0000
 TAG_CHAR_END = 0xE007F
 
 
-def detect_zero_width_chars(text: str) -> List[Dict]:
+# Merged lookup for the single-pass character scan: char -> (category, description)
+CHAR_META = {}
+for _char, _description in ZERO_WIDTH_CHARS.items():
+    CHAR_META[_char] = ('zero_width', _description)
+for _char, _description in BIDI_CHARS.items():
+    CHAR_META[_char] = ('bidi_override', _description)
+for _char, (_replacement, _description) in HOMOGLYPHS.items():
+    CHAR_META[_char] = ('homoglyph', _description)
+
+# Frozen views of the tables above for the detectors' hot loops
+ZERO_WIDTH_ITEMS = tuple(ZERO_WIDTH_CHARS.items())
+BIDI_ITEMS = tuple(BIDI_CHARS.items())
+HOMOGLYPH_ITEMS = tuple(HOMOGLYPHS.items())
+HOMOGLYPH_CHARSET = frozenset(HOMOGLYPHS)
+
+
+def is_control_code(code: int) -> bool:
+    """ASCII control chars (except tab, newline, carriage return) and C1 controls"""
+    return (code < 32 and code not in (9, 10, 13)) or code == 127 or 0x80 <= code <= 0x9F
+
+
+# str.translate table used by clean_text: removals map to None,
+# homoglyphs map to their Latin equivalent
+CLEAN_TABLE = {}
+for _char in ZERO_WIDTH_CHARS:
+    CLEAN_TABLE[ord(_char)] = None
+for _char in BIDI_CHARS:
+    CLEAN_TABLE[ord(_char)] = None
+for _char, (_replacement, _description) in HOMOGLYPHS.items():
+    CLEAN_TABLE[ord(_char)] = _replacement or None
+for _code in range(0xA0):
+    if is_control_code(_code):
+        CLEAN_TABLE.setdefault(_code, None)
+for _code in range(TAG_CHAR_START, TAG_CHAR_END + 1):
+    CLEAN_TABLE[_code] = None
+
+TAG_CHAR_RE = re.compile('[%s-%s]' % (chr(TAG_CHAR_START), chr(TAG_CHAR_END)))
+
+# str.translate looks every character of a non-ASCII string up in the table,
+# so when _scan found only a few distinct characters it is much faster to
+# remove each one with str.replace (a C substring search)
+MAX_REPLACE_CHARS = 32
+
+
+def strip_found_chars(text: str, scan: Dict) -> str:
+    """Apply CLEAN_TABLE to the characters _scan found in text"""
+    found = scan['chars']
+    if text.isascii() or len(found) > MAX_REPLACE_CHARS:
+        return text.translate(CLEAN_TABLE)
+    for char in found:
+        text = text.replace(char, CLEAN_TABLE[ord(char)] or '')
+    if scan['tags']['count']:
+        text = TAG_CHAR_RE.sub('', text)
+    return text
+
+
+# In pure-ASCII text the only characters of interest are ASCII controls
+# (which include the two control-code entries in HOMOGLYPHS). Deleting every
+# other byte with bytes.translate leaves just those, in order, in one C call.
+ASCII_NON_CONTROL_BYTES = bytes(code for code in range(256) if not (code < 0x80 and is_control_code(code)))
+
+# Every character _scan cares about, as one character class. The regex engine
+# compiles it to a membership bitmap, so finditer() skips everything else in C.
+SCAN_CHAR_RE = re.compile('[%s%s%s-%s]' % (
+    ''.join(re.escape(chr(code)) for code in range(0xA0) if is_control_code(code)),
+    ''.join(re.escape(char) for char in CHAR_META),
+    chr(TAG_CHAR_START),
+    chr(TAG_CHAR_END),
+))
+
+# Non-ASCII inputs at least this long are pre-filtered with numpy instead,
+# which beats the regex bitmap once the codepoint array setup is amortized.
+# The regex cost grows with the number of hits, the numpy cost barely does:
+# text with few suspicious characters breaks even around 512-1024 characters,
+# text with many is already several times faster with numpy at 512.
+NUMPY_SCAN_MIN_LENGTH = 512
+
+# Category bit flags per codepoint
+CATEGORY_ZERO_WIDTH = 1
+CATEGORY_BIDI = 2
+CATEGORY_HOMOGLYPH = 4
+CATEGORY_CONTROL = 8
+CATEGORY_TAG = 16
+CATEGORY_FLAGS = {'zero_width': CATEGORY_ZERO_WIDTH, 'bidi_override': CATEGORY_BIDI, 'homoglyph': CATEGORY_HOMOGLYPH}
+
+# One byte of category flags for every codepoint (1.1 MB), so classifying a
+# string is a single gather with no range checks
+CATEGORY_TABLE = np.zeros(0x110000, dtype=np.uint8)
+for _char, (_category, _description) in CHAR_META.items():
+    CATEGORY_TABLE[ord(_char)] |= CATEGORY_FLAGS[_category]
+for _code in range(0xA0):
+    if is_control_code(_code):
+        CATEGORY_TABLE[_code] |= CATEGORY_CONTROL
+CATEGORY_TABLE[TAG_CHAR_START:TAG_CHAR_END + 1] |= CATEGORY_TAG
+
+
+def _candidate_positions(text: str) -> List[int]:
+    """Vectorized classification: positions of every control, tag or CHAR_META character"""
+    codepoints = np.frombuffer(text.encode('utf-32-le', errors='surrogatepass'), dtype=np.uint32)
+    # np.take is a tighter gather loop than fancy indexing
+    return np.flatnonzero(np.take(CATEGORY_TABLE, codepoints)).tolist()
+
+
+@lru_cache(maxsize=16)
+def _scan(text: str) -> Dict[str, Any]:
+    """
+    Walk the text once and bucket every character of interest.
+    Returns per-char counts and first 10 positions (in first-seen order),
+    plus the tag character data needed for ASCII smuggling decoding.
+    The result is cached and shared, callers must not mutate it.
+    """
+    chars = {}
+    tags = {'count': 0, 'positions': [], 'decoded': []}
+
+    if text.isascii():
+        # Only ASCII controls can occur. Count them at the bytes level and
+        # find just the first 10 positions of each with str.find.
+        controls = text.encode('ascii').translate(None, ASCII_NON_CONTROL_BYTES)
+        for code in dict.fromkeys(controls):
+            char = chr(code)
+            positions = []
+            i = text.find(char)
+            while i != -1 and len(positions) < 10:
+                positions.append(i)
+                i = text.find(char, i + 1)
+            chars[char] = {'count': controls.count(code), 'positions': positions}
+        return {'chars': chars, 'tags': tags}
+
+    if len(text) < NUMPY_SCAN_MIN_LENGTH:
+        candidates = ((match.start(), match.group()) for match in SCAN_CHAR_RE.finditer(text))
+    else:
+        candidates = ((i, text[i]) for i in _candidate_positions(text))
+
+    for i, char in candidates:
+        if char not in CHAR_META:
+            code = ord(char)
+            if TAG_CHAR_START <= code <= TAG_CHAR_END:
+                tags['count'] += 1
+                if len(tags['positions']) < 10:
+                    tags['positions'].append(i)
+                if code > TAG_CHAR_START and len(tags['decoded']) < 100:
+                    tags['decoded'].append(chr(code - TAG_CHAR_START))
+                continue
+            if not is_control_code(code):
+                continue
+        bucket = chars.get(char)
+        if bucket is None:
+            bucket = chars[char] = {'count': 0, 'positions': []}
+        bucket['count'] += 1
+        if len(bucket['positions']) < 10:
+            bucket['positions'].append(i)
+
+    return {'chars': chars, 'tags': tags}
+
+
+def _make_char_finding(ftype: str, char: str, description: str, data: Dict, severity: str,
+                       character: Optional[str] = None, **extra) -> Dict:
+    """Build a per-character finding from a _scan() bucket"""
+    finding = {
+        'type': ftype,
+        'character': repr(char) if character is None else character,
+        'unicode': f'U+{ord(char):04X}',
+        'description': description,
+    }
+    finding.update(extra)
+    finding['count'] = data['count']
+    finding['positions'] = data['positions'][:10]
+    finding['severity'] = severity
+    return finding
+
+
+def detect_zero_width_chars(text: str, scan: Optional[Dict] = None) -> List[Dict]:
     """Detect zero-width and invisible characters"""
     findings = []
-    for char, description in ZERO_WIDTH_CHARS.items():
-        count = text.count(char)
-        if count > 0:
-            positions = [i for i, c in enumerate(text) if c == char]
-            findings.append({
-                'type': 'zero_width',
-                'character': repr(char),
-                'unicode': f'U+{ord(char):04X}',
-                'description': description,
-                'count': count,
-                'positions': positions[:10],  # Limit to first 10
-                'severity': 'high'
-            })
+    found = (scan or _scan(text))['chars']
+    for char, description in ZERO_WIDTH_ITEMS:
+        data = found.get(char)
+        if data:
+            findings.append(_make_char_finding('zero_width', char, description, data, 'high'))
     return findings
 
 
-def detect_bidi_chars(text: str) -> List[Dict]:
+def detect_bidi_chars(text: str, scan: Optional[Dict] = None) -> List[Dict]:
     """Detect bidirectional control characters"""
     findings = []
-    for char, description in BIDI_CHARS.items():
-        count = text.count(char)
-        if count > 0:
-            positions = [i for i, c in enumerate(text) if c == char]
-            findings.append({
-                'type': 'bidi_override',
-                'character': repr(char),
-                'unicode': f'U+{ord(char):04X}',
-                'description': description,
-                'count': count,
-                'positions': positions[:10],
-                'severity': 'high'
-            })
+    found = (scan or _scan(text))['chars']
+    for char, description in BIDI_ITEMS:
+        data = found.get(char)
+        if data:
+            findings.append(_make_char_finding('bidi_override', char, description, data, 'high'))
     return findings
 
 
-def detect_homoglyphs(text: str) -> List[Dict]:
+def detect_homoglyphs(text: str, scan: Optional[Dict] = None) -> List[Dict]:
     """Detect homoglyph characters (lookalikes)"""
     findings = []
-    for char, (replacement, description) in HOMOGLYPHS.items():
-        count = text.count(char)
-        if count > 0:
-            positions = [i for i, c in enumerate(text) if c == char]
-            findings.append({
-                'type': 'homoglyph',
-                'character': char,
-                'unicode': f'U+{ord(char):04X}',
-                'description': description,
-                'looks_like': replacement,
-                'count': count,
-                'positions': positions[:10],
-                'severity': 'medium'
-            })
+    found = (scan or _scan(text))['chars']
+    for char, (replacement, description) in HOMOGLYPH_ITEMS:
+        data = found.get(char)
+        if data:
+            findings.append(_make_char_finding('homoglyph', char, description, data, 'medium',
+                                               character=char, looks_like=replacement))
     return findings
 
 
-def detect_control_chars(text: str) -> List[Dict]:
+def detect_control_chars(text: str, scan: Optional[Dict] = None) -> List[Dict]:
     """Detect ASCII and Unicode control characters"""
     findings = []
-    control_found = {}
-    
-    for i, char in enumerate(text):
-        code = ord(char)
-        # ASCII control chars (except common ones like tab, newline)
-        if (code < 32 and code not in [9, 10, 13]) or code == 127:
-            if char not in control_found:
-                control_found[char] = {'count': 0, 'positions': []}
-            control_found[char]['count'] += 1
-            if len(control_found[char]['positions']) < 10:
-                control_found[char]['positions'].append(i)
-        # C1 control characters
-        elif 0x80 <= code <= 0x9F:
-            if char not in control_found:
-                control_found[char] = {'count': 0, 'positions': []}
-            control_found[char]['count'] += 1
-            if len(control_found[char]['positions']) < 10:
-                control_found[char]['positions'].append(i)
-    
-    for char, data in control_found.items():
-        findings.append({
-            'type': 'control_char',
-            'character': repr(char),
-            'unicode': f'U+{ord(char):04X}',
-            'description': f'Control character at codepoint {ord(char)}',
-            'count': data['count'],
-            'positions': data['positions'],
-            'severity': 'high'
-        })
+    
+    for char, data in (scan or _scan(text))['chars'].items():
+        if not is_control_code(ord(char)):
+            continue
+        findings.append(_make_char_finding('control_char', char, f'Control character at codepoint {ord(char)}',
+                                           data, 'high'))
     
     return findings
 
 
-def detect_tag_chars(text: str) -> List[Dict]:
+def detect_tag_chars(text: str, scan: Optional[Dict] = None) -> List[Dict]:
     """Detect Unicode tag characters (ASCII smuggling)"""
     findings = []
-    tag_chars_found = []
-    
-    for i, char in enumerate(text):
-        code = ord(char)
-        if TAG_CHAR_START <= code <= TAG_CHAR_END:
-            tag_chars_found.append({
-                'position': i,
-                'code': code,
-                'decoded': chr(code - TAG_CHAR_START) if code > TAG_CHAR_START else ''
-            })
+    tags = (scan or _scan(text))['tags']
     
-    if tag_chars_found:
+    if tags['count']:
         # Try to decode the hidden message
-        hidden_message = ''.join([t['decoded'] for t in tag_chars_found])
+        hidden_message = ''.join(tags['decoded'])
         findings.append({
             'type': 'ascii_smuggling',
             'description': 'Unicode tag characters detected (ASCII smuggling)',
-            'count': len(tag_chars_found),
-            'positions': [t['position'] for t in tag_chars_found[:10]],
-            'hidden_content': hidden_message[:100] if hidden_message else None,
+            'count': tags['count'],
+            'positions': tags['positions'][:10],
+            'hidden_content': hidden_message if hidden_message else None,
             'severity': 'critical'
         })
     
     return findings
 
 
-def detect_instruction_patterns(text: str) -> List[Dict]:
+def detect_unicode_threats(text: str, scan: Optional[Dict] = None) -> List[Dict]:
+    """
+    All character-level findings from a single scan of the text, in the
+    order of the individual zero-width/bidi/homoglyph/control/tag detectors.
+    """
+    scan = scan or _scan(text)
+    # Zero-width, bidi and tag characters are all non-ASCII, so those
+    # detectors have nothing to find in ASCII text
+    if text.isascii():
+        return list(chain(detect_homoglyphs(text, scan), detect_control_chars(text, scan)))
+    return list(chain(
+        detect_zero_width_chars(text, scan),
+        detect_bidi_chars(text, scan),
+        detect_homoglyphs(text, scan),
+        detect_control_chars(text, scan),
+        detect_tag_chars(text, scan),
+    ))
+
+
+def detect_instruction_patterns(text: str, text_lower: Optional[str] = None) -> List[Dict]:
     """Detect suspicious instruction override patterns"""
     findings = []
-    text_lower = text.lower()
+    if text_lower is None:
+        text_lower = fold_case(text)
     
-    for pattern, description in INSTRUCTION_PATTERNS:
-        matches = list(re.finditer(pattern, text_lower, re.IGNORECASE))
+    for pattern, regex, description in COMPILED_INSTRUCTION_PATTERNS:
+        matches = list(regex.finditer(text_lower))
         if matches:
             findings.append({
                 'type': 'instruction_injection',
@@ -350,31 +561,153 @@ SUSPICIOUS_KEYWORDS = [
     'dan mode', 'developer mode', 'unrestricted', 'no filter'
 ]
 
+# A keyword that contains a shorter keyword can only be present when the shorter
+# one is, so searching shortest-first lets check_content_for_threats skip it
+KEYWORD_SEARCH_ORDER = tuple(sorted(SUSPICIOUS_KEYWORDS, key=len))
+KEYWORD_PREREQUISITES = {
+    keyword: next((other for other in KEYWORD_SEARCH_ORDER if other != keyword and other in keyword), None)
+    for keyword in SUSPICIOUS_KEYWORDS
+}
+
+# Pattern for base64: valid charset, reasonable length, multiple of 4 (or close)
+# More permissive pattern to catch various base64 formats.
+# These and the hex patterns match str, not UTF-8 bytes: CPython already stores
+# ASCII and Latin-1 text one byte per character, so a bytes pattern was no
+# faster and would need an encode per scan plus byte-to-char offset mapping.
+BASE64_PATTERNS = [
+    re.compile(r'[A-Za-z0-9+/]{16,}={0,2}'),  # Standard base64, min 16 chars
+    re.compile(r'[A-Za-z0-9_-]{16,}={0,2}'),   # URL-safe base64
+]
+BASE64_CHARSET_RE = re.compile(r'^[A-Za-z0-9+/]*={0,2}$')
+
+# Base64 candidates and raw hex strings all need a run of at least 16 characters
+# from this set. Mapping every byte to 'a' (in the set) or ' ' (not in it) lets
+# one substring search rule out text that has no such run, which is most prose
+# and much cheaper than the candidate regexes retrying at every word.
+ENCODED_RUN_CHARS = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/_-'
+ENCODED_RUN_TABLE = bytes(0x61 if code in ENCODED_RUN_CHARS else 0x20 for code in range(256))
+ENCODED_RUN = b'a' * 16
+
+
+@lru_cache(maxsize=16)
+def has_encoded_run(text: str) -> bool:
+    """False only if text cannot contain a base64 or raw hex candidate"""
+    # Dropping non-ASCII characters can only join runs, never break one up
+    return ENCODED_RUN in text.encode('ascii', errors='ignore').translate(ENCODED_RUN_TABLE)
+
+
+# Per-detector cost caps for pathological input: only the first
+# MAX_ENCODED_CANDIDATES matches of each pattern are examined, and at most
+# MAX_DECODE_LENGTH characters of any one candidate are decoded
+MAX_ENCODED_CANDIDATES = 200
+MAX_DECODE_LENGTH = 4096
+
+# Decoding and decoded-content threat checks are cached only for short
+# inputs. lru_cache bounds entries, not bytes, and a full-length candidate
+# with all its decoded layers can hold tens of KB.
+MAX_CACHED_DECODE_LENGTH = 1024
+DECODE_CACHE_SIZE = 256
+
+
+def cache_short(func):
+    """lru_cache func for calls whose first argument is at most MAX_CACHED_DECODE_LENGTH long"""
+    cached = lru_cache(maxsize=DECODE_CACHE_SIZE)(func)
+    
+    @wraps(func)
+    def wrapper(text, *args):
+        if len(text) <= MAX_CACHED_DECODE_LENGTH:
+            return cached(text, *args)
+        return func(text, *args)
+    
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+# Various hex patterns. The prefixed ones spell out their first repetition
+# (X(?:X){7,} rather than (?:X){8,}, which matches the same) so the regex
+# engine can jump between occurrences of the literal prefix.
+HEX_PATTERNS = [
+    (re.compile(r'0x[0-9a-fA-F]{2}[\s,]*(?:0x[0-9a-fA-F]{2}[\s,]*){7,}'), 'Hex with 0x prefix'),
+    (re.compile(r'\\x[0-9a-fA-F]{2}(?:\\x[0-9a-fA-F]{2}){7,}'), 'Hex with \\x prefix'),
+    (re.compile(r'%[0-9a-fA-F]{2}(?:%[0-9a-fA-F]{2}){7,}'), 'URL-encoded hex'),
+    (re.compile(r'\b[0-9a-fA-F]{16,}\b'), 'Raw hex string'),
+]
+
+
+ROT13_TABLE = str.maketrans(
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
+    'NOPQRSTUVWXYZABCDEFGHIJKLMnopqrstuvwxyzabcdefghijklm'
+)
+
+# ROT13 of common injection words
+ROT13_SUSPICIOUS = {
+    'vtaber': 'ignore',
+    'flfgrz': 'system', 
+    'cebzcg': 'prompt',
+    'vafgehpgvba': 'instruction',
+    'bireeevqr': 'override',
+    'wnvyoernx': 'jailbreak',
+    'olcnff': 'bypass',
+    'qvfertneq': 'disregard',
+    'sbetrg': 'forget',
+    'cergraq': 'pretend'
+}
+
 
 def rot13_decode(text: str) -> str:
     """Decode ROT13 encoded text"""
-    result = []
-    for char in text:
-        if 'a' <= char <= 'z':
-            result.append(chr((ord(char) - ord('a') + 13) % 26 + ord('a')))
-        elif 'A' <= char <= 'Z':
-            result.append(chr((ord(char) - ord('A') + 13) % 26 + ord('A')))
-        else:
-            result.append(char)
-    return ''.join(result)
+    return text.translate(ROT13_TABLE)
 
 
-def hex_decode(text: str) -> str:
-    """Decode hex encoded text"""
-    try:
-        # Remove common hex prefixes and separators
-        cleaned = re.sub(r'(0x|\\x|%)', '', text)
-        cleaned = re.sub(r'[\s,;:-]', '', cleaned)
-        if len(cleaned) % 2 == 0 and all(c in '0123456789abcdefABCDEF' for c in cleaned):
-            return bytes.fromhex(cleaned).decode('utf-8', errors='ignore')
-    except:
-        pass
-    return ''
+# Decoders for the text matched by each of HEX_PATTERNS. Every pattern
+# only admits pairs of hex digits plus its own prefix and separators, so
+# each decoder strips exactly those and hands the rest to bytes.fromhex.
+
+@cache_short
+def hex_decode_0x(text: str) -> str:
+    """Decode a 0x-prefixed hex match (separated by whitespace or commas)"""
+    return bytes.fromhex(''.join(text.replace('0x', '').replace(',', ' ').split())).decode('utf-8', errors='ignore')
+
+
+@cache_short
+def hex_decode_bs_x(text: str) -> str:
+    """Decode a \\x-escaped hex match"""
+    return bytes.fromhex(text.replace('\\x', '')).decode('utf-8', errors='ignore')
+
+
+@cache_short
+def hex_decode_url(text: str) -> str:
+    """Decode a URL-encoded (%XX) hex match"""
+    return bytes.fromhex(text.replace('%', '')).decode('utf-8', errors='ignore')
+
+
+@cache_short
+def hex_decode_raw(text: str) -> str:
+    """Decode a raw hex string match"""
+    if len(text) % 2:
+        return ''
+    return bytes.fromhex(text).decode('utf-8', errors='ignore')
+
+
+# Specialized decoder and per-byte prefix for each entry in HEX_PATTERNS,
+# in the same order
+HEX_DECODERS = [
+    (hex_decode_0x, '0x'),
+    (hex_decode_bs_x, '\\x'),
+    (hex_decode_url, '%'),
+    (hex_decode_raw, ''),
+]
+
+
+def truncate_hex(text: str, prefix: str, limit: int = MAX_DECODE_LENGTH) -> str:
+    """Cut a hex match to at most limit characters without splitting a byte"""
+    if len(text) <= limit:
+        return text
+    if not prefix:
+        return text[:limit - limit % 2]
+    # End after the last prefix+2-digit byte that fits within limit
+    cut = text.rfind(prefix, 0, limit - 2)
+    return text[:cut + len(prefix) + 2]
 
 
 def is_valid_base64(s: str) -> bool:
@@ -384,8 +717,8 @@ def is_valid_base64(s: str) -> bool:
     if not s:
         return False
     
-    # Remove whitespace
-    s = re.sub(r'\s', '', s)
+    # Remove whitespace (str.split() uses the same whitespace set as regex \s)
+    s = ''.join(s.split())
     
     # Check length (valid base64 is always multiple of 4)
     if len(s) % 4 != 0:
@@ -393,7 +726,7 @@ def is_valid_base64(s: str) -> bool:
         s = s + '=' * (4 - len(s) % 4)
     
     # Check character set
-    if not re.match(r'^[A-Za-z0-9+/]*={0,2}$', s):
+    if not BASE64_CHARSET_RE.match(s):
         return False
     
     # Minimum length to be meaningful
@@ -403,10 +736,23 @@ def is_valid_base64(s: str) -> bool:
     return True
 
 
-def decode_base64_recursive(text: str, max_depth: int = 5) -> List[Dict]:
+def printable_ratio(text: str) -> float:
+    """Fraction of characters that are printable or whitespace"""
+    if not text:
+        return 0.0
+    # Whitespace counts as printable; check the rest in one C-level call
+    visible = ''.join(text.split())
+    if visible.isprintable():
+        return 1.0
+    printable = len(text) - len(visible) + sum(c.isprintable() for c in visible)
+    return printable / len(text)
+
+
+@cache_short
+def _decode_base64_layers(text: str, max_depth: int) -> tuple:
     """
-    Recursively decode base64 content up to max_depth layers.
-    Returns list of decoded layers with metadata.
+    Cached worker for decode_base64_recursive.
+    Returns an immutable tuple of (depth, encoded, decoded, full_decoded) layers.
     """
     layers = []
     current = text
@@ -414,7 +760,7 @@ def decode_base64_recursive(text: str, max_depth: int = 5) -> List[Dict]:
     
     while depth < max_depth:
         # Clean whitespace
-        current_clean = re.sub(r'\s', '', current)
+        current_clean = ''.join(current.split())
         
         # Check if it's valid base64
         if not is_valid_base64(current_clean):
@@ -429,16 +775,15 @@ def decode_base64_recursive(text: str, max_depth: int = 5) -> List[Dict]:
             decoded = base64.b64decode(current_clean).decode('utf-8', errors='ignore')
             
             # Check if decoded content is printable/meaningful
-            printable_ratio = sum(c.isprintable() or c.isspace() for c in decoded) / max(len(decoded), 1)
-            if printable_ratio < 0.7:
+            if printable_ratio(decoded) < 0.7:
                 break
             
-            layers.append({
-                'depth': depth + 1,
-                'encoded': current_clean[:50] + '...' if len(current_clean) > 50 else current_clean,
-                'decoded': decoded[:200] if len(decoded) > 200 else decoded,
-                'full_decoded': decoded
-            })
+            layers.append((
+                depth + 1,
+                current_clean[:50] + '...' if len(current_clean) > 50 else current_clean,
+                decoded[:200] if len(decoded) > 200 else decoded,
+                decoded
+            ))
             
             current = decoded
             depth += 1
@@ -446,25 +791,49 @@ def decode_base64_recursive(text: str, max_depth: int = 5) -> List[Dict]:
         except Exception:
             break
     
-    return layers
+    return tuple(layers)
+
+
+def decode_base64_recursive(text: str, max_depth: int = 5) -> List[Dict]:
+    """
+    Recursively decode base64 content up to max_depth layers.
+    Returns list of decoded layers with metadata.
+    """
+    return [
+        {'depth': depth, 'encoded': encoded, 'decoded': decoded, 'full_decoded': full_decoded}
+        for depth, encoded, decoded, full_decoded in _decode_base64_layers(text, max_depth)
+    ]
+
+
+# Longest decoded content checked for threats in one call
+MAX_THREAT_CHECK_LENGTH = 16 * 1024
 
 
 def check_content_for_threats(content: str) -> List[str]:
     """Check decoded content for suspicious patterns"""
+    return list(_threats_in(content[:MAX_THREAT_CHECK_LENGTH]))
+
+
+@cache_short
+def _threats_in(content: str) -> tuple:
+    """Threat descriptions for content, cached since the same payloads recur"""
     threats_found = []
-    content_lower = content.lower()
+    content_lower = fold_case(content)
     
     # Check for suspicious keywords
-    for keyword in SUSPICIOUS_KEYWORDS:
-        if keyword in content_lower:
-            threats_found.append(f"Contains '{keyword}'")
+    present = set()
+    for keyword in KEYWORD_SEARCH_ORDER:
+        required = KEYWORD_PREREQUISITES[keyword]
+        if (required is None or required in present) and keyword in content_lower:
+            present.add(keyword)
+    threats_found.extend(f"Contains '{keyword}'" for keyword in SUSPICIOUS_KEYWORDS if keyword in present)
     
     # Check for instruction injection patterns
-    for pattern, description in INSTRUCTION_PATTERNS:
-        if re.search(pattern, content_lower, re.IGNORECASE):
+    for pattern, regex, description in COMPILED_INSTRUCTION_PATTERNS:
+        if regex.search(content_lower):
             threats_found.append(description)
     
-    return threats_found
+    return tuple(threats_found)
 
 
 def detect_base64_payloads(text: str) -> List[Dict]:
@@ -473,18 +842,13 @@ def detect_base64_payloads(text: str) -> List[Dict]:
     Handles nested base64 (up to 5 layers deep).
     """
     findings = []
-    
-    # Pattern for base64: valid charset, reasonable length, multiple of 4 (or close)
-    # More permissive pattern to catch various base64 formats
-    base64_patterns = [
-        r'[A-Za-z0-9+/]{16,}={0,2}',  # Standard base64, min 16 chars
-        r'[A-Za-z0-9_-]{16,}={0,2}',   # URL-safe base64
-    ]
+    if not has_encoded_run(text):
+        return findings
     
     found_positions = set()  # Avoid duplicate detections
     
-    for pattern in base64_patterns:
-        matches = list(re.finditer(pattern, text))
+    for pattern in BASE64_PATTERNS:
+        matches = islice(pattern.finditer(text), MAX_ENCODED_CANDIDATES)
         
         for match in matches:
             if match.start() in found_positions:
@@ -496,8 +860,14 @@ def detect_base64_payloads(text: str) -> List[Dict]:
             if potential_b64.isalpha() and len(potential_b64) < 30:
                 continue
             
+            # Cheap gates for candidates is_valid_base64 would reject anyway:
+            # '-' and '_' are outside the standard alphabet it accepts, and a
+            # length of 4n+1 cannot be padded to a valid length
+            if len(potential_b64) % 4 == 1 or '-' in potential_b64 or '_' in potential_b64:
+                continue
+            
             # Try recursive decoding
-            layers = decode_base64_recursive(potential_b64)
+            layers = decode_base64_recursive(potential_b64[:MAX_DECODE_LENGTH])
             
             if layers:
                 found_positions.add(match.start())
@@ -552,20 +922,15 @@ def detect_hex_payloads(text: str) -> List[Dict]:
     """Detect hex encoded payloads"""
     findings = []
     
-    # Various hex patterns
-    hex_patterns = [
-        (r'(?:0x[0-9a-fA-F]{2}[\s,]*){8,}', 'Hex with 0x prefix'),
-        (r'(?:\\x[0-9a-fA-F]{2}){8,}', 'Hex with \\x prefix'),
-        (r'(?:%[0-9a-fA-F]{2}){8,}', 'URL-encoded hex'),
-        (r'\b[0-9a-fA-F]{16,}\b', 'Raw hex string'),
-    ]
-    
-    for pattern, desc in hex_patterns:
-        matches = list(re.finditer(pattern, text))
+    for (pattern, desc), (decoder, prefix) in zip(HEX_PATTERNS, HEX_DECODERS):
+        # Raw hex needs an unbroken run of 16 hex digits
+        if not prefix and not has_encoded_run(text):
+            continue
+        matches = islice(pattern.finditer(text), MAX_ENCODED_CANDIDATES)
         
         for match in matches:
             hex_str = match.group()
-            decoded = hex_decode(hex_str)
+            decoded = decoder(truncate_hex(hex_str, prefix))
             
             if decoded and len(decoded) >= 4:
                 threats = check_content_for_threats(decoded)
@@ -590,32 +955,18 @@ def detect_hex_payloads(text: str) -> List[Dict]:
     return findings
 
 
-def detect_rot13_payloads(text: str) -> List[Dict]:
+def detect_rot13_payloads(text: str, text_lower: Optional[str] = None) -> List[Dict]:
     """Detect ROT13 encoded payloads by checking if decoding reveals suspicious content"""
     findings = []
     
     # Look for word-like patterns that might be ROT13
-    # ROT13 of common injection words
-    rot13_suspicious = {
-        'vtaber': 'ignore',
-        'flfgrz': 'system', 
-        'cebzcg': 'prompt',
-        'vafgehpgvba': 'instruction',
-        'bireeevqr': 'override',
-        'wnvyoernx': 'jailbreak',
-        'olcnff': 'bypass',
-        'qvfertneq': 'disregard',
-        'sbetrg': 'forget',
-        'cergraq': 'pretend'
-    }
+    if text_lower is None:
+        text_lower = fold_case(text)
     
-    text_lower = text.lower()
-    
-    for encoded, decoded in rot13_suspicious.items():
-        if encoded in text_lower:
-            # Find the position
-            pos = text_lower.find(encoded)
-            
+    for encoded, decoded in ROT13_SUSPICIOUS.items():
+        # Find the position
+        pos = text_lower.find(encoded)
+        if pos != -1:
             # Decode a larger context around it
             start = max(0, pos - 50)
             end = min(len(text), pos + len(encoded) + 50)
@@ -636,30 +987,28 @@ def detect_rot13_payloads(text: str) -> List[Dict]:
     return findings
 
 
-def detect_delimiter_injection(text: str) -> List[Dict]:
+def detect_delimiter_injection(text: str, text_lower: Optional[str] = None) -> List[Dict]:
     """Detect delimiter/separator injection attempts"""
     findings = []
-    delimiter_patterns = [
-        (r'```[\s\S]*?```', 'Code block delimiter'),
-        (r'<\|[^|]+\|>', 'Pipe delimiter'),
-        (r'\[INST\]', 'Instruction marker'),
-        (r'\[/INST\]', 'Instruction marker'),
-        (r'<<SYS>>', 'System tag'),
-        (r'<</SYS>>', 'System tag'),
-        (r'Human:', 'Role marker'),
-        (r'Assistant:', 'Role marker'),
-        (r'###\s*Human', 'Role delimiter'),
-        (r'###\s*Assistant', 'Role delimiter'),
-    ]
+    if text_lower is None:
+        text_lower = fold_case(text)
+    
+    # Matches are reported from the original text, so positions must line up.
+    # Lowercasing lengthens a few characters (e.g. U+0130), in which case
+    # fall back to case-insensitive matching on the original.
+    same_length = len(text_lower) == len(text)
     
-    for pattern, description in delimiter_patterns:
-        matches = list(re.finditer(pattern, text, re.IGNORECASE))
+    for pattern, regex, ignorecase_regex, description in COMPILED_DELIMITER_PATTERNS:
+        if same_length:
+            matches = list(regex.finditer(text_lower))
+        else:
+            matches = list(ignorecase_regex.finditer(text))
         if matches:
             findings.append({
                 'type': 'delimiter_injection',
                 'pattern': pattern,
                 'description': description,
-                'matches': [m.group()[:50] for m in matches[:5]],
+                'matches': [text[m.start():m.end()][:50] for m in matches[:5]],
                 'positions': [m.start() for m in matches[:5]],
                 'count': len(matches),
                 'severity': 'medium'
@@ -668,64 +1017,47 @@ def detect_delimiter_injection(text: str) -> List[Dict]:
     return findings
 
 
-def clean_text(text: str) -> Dict[str, Any]:
-    """Clean text by removing all detected threats"""
+def clean_text(text: str, scan: Optional[Dict] = None) -> Dict[str, Any]:
+    """
+    Clean text by removing all detected threats.
+    Reuses the _scan() result when the caller already has it.
+    """
     original_length = len(text)
-    cleaned = text
+    scan = scan or _scan(text)
+    found = scan['chars']
     removed = []
     
-    # Remove zero-width characters
-    for char in ZERO_WIDTH_CHARS.keys():
-        if char in cleaned:
-            count = cleaned.count(char)
-            cleaned = cleaned.replace(char, '')
-            removed.append({'type': 'zero_width', 'count': count})
-    
-    # Remove bidirectional characters
-    for char in BIDI_CHARS.keys():
-        if char in cleaned:
-            count = cleaned.count(char)
-            cleaned = cleaned.replace(char, '')
-            removed.append({'type': 'bidi', 'count': count})
-    
-    # Replace homoglyphs with Latin equivalents
-    homoglyph_count = 0
-    for char, (replacement, _) in HOMOGLYPHS.items():
-        if char in cleaned:
-            count = cleaned.count(char)
-            cleaned = cleaned.replace(char, replacement)
-            homoglyph_count += count
+    # Zero-width and bidirectional characters
+    for char in ZERO_WIDTH_CHARS:
+        if char in found:
+            removed.append({'type': 'zero_width', 'count': found[char]['count']})
+    for char in BIDI_CHARS:
+        if char in found:
+            removed.append({'type': 'bidi', 'count': found[char]['count']})
+    
+    # Homoglyphs are replaced with Latin equivalents
+    homoglyph_count = sum(found[char]['count'] for char in HOMOGLYPHS if char in found)
     if homoglyph_count > 0:
         removed.append({'type': 'homoglyph', 'count': homoglyph_count})
     
-    # Remove control characters (except tab, newline, carriage return)
-    control_count = 0
-    result = []
-    for char in cleaned:
-        code = ord(char)
-        if (code < 32 and code not in [9, 10, 13]) or code == 127 or (0x80 <= code <= 0x9F):
-            control_count += 1
-        else:
-            result.append(char)
-    cleaned = ''.join(result)
+    # Control characters (except tab, newline, carriage return)
+    control_count = sum(
+        data['count'] for char, data in found.items()
+        if char not in HOMOGLYPH_CHARSET and is_control_code(ord(char))
+    )
     if control_count > 0:
         removed.append({'type': 'control', 'count': control_count})
     
-    # Remove tag characters (ASCII smuggling)
-    tag_count = 0
-    result = []
-    for char in cleaned:
-        code = ord(char)
-        if TAG_CHAR_START <= code <= TAG_CHAR_END:
-            tag_count += 1
-        else:
-            result.append(char)
-    cleaned = ''.join(result)
+    # Tag characters (ASCII smuggling)
+    tag_count = scan['tags']['count']
     if tag_count > 0:
         removed.append({'type': 'tag_chars', 'count': tag_count})
     
-    # Unicode normalization (NFKC)
-    cleaned = unicodedata.normalize('NFKC', cleaned)
+    # Strip and replace what the scan found, then normalize (NFKC).
+    # ASCII text is already NFKC-normalized and only needs its controls removed.
+    cleaned = strip_found_chars(text, scan) if found or tag_count else text
+    if not text.isascii():
+        cleaned = unicodedata.normalize('NFKC', cleaned)
     
     return {
         'original_length': original_length,
@@ -736,6 +1068,47 @@ def clean_text(text: str) -> Dict[str, Any]:
     }
 
 
+def scan_and_clean(text: str) -> tuple:
+    """Character-level findings and the cleaned text, from one shared scan"""
+    scan = _scan(text)
+    return detect_unicode_threats(text, scan), clean_text(text, scan)
+
+
+def _compute_scan(text: str) -> tuple:
+    """Findings, threat level and per-type summary for a /scan request"""
+    findings = run_detectors(text)
+    threat_level = calculate_threat_level(findings)
+    
+    # Create summary by type: total count and first-seen severity
+    counts = Counter()
+    severities = {}
+    for finding in findings:
+        ftype = finding['type']
+        counts[ftype] += finding.get('count', 1)
+        severities.setdefault(ftype, finding.get('severity', 'unknown'))
+    summary = {ftype: {'count': count, 'severity': severities[ftype]} for ftype, count in counts.items()}
+    
+    return findings, threat_level, summary
+
+
+# Repeated payloads (bots, test suites) are answered from a cache. lru_cache
+# bounds entries, not bytes, and a result full of findings holds tens of KB,
+# so both the cached text length and the entry count are kept small: a full
+# cache of worst-case payloads stays around 10-20 MB.
+MAX_CACHED_SCAN_LENGTH = 2048
+_cached_compute_scan = lru_cache(maxsize=256)(_compute_scan)
+
+
+def compute_scan(text: str) -> tuple:
+    """
+    _compute_scan(), cached for short texts.
+    The result may be shared between requests, callers must not mutate it.
+    """
+    if len(text) <= MAX_CACHED_SCAN_LENGTH:
+        return _cached_compute_scan(text)
+    return _compute_scan(text)
+
+
 def calculate_threat_level(findings: List[Dict]) -> str:
     """Calculate overall threat level based on findings"""
     if not findings:
@@ -753,14 +1126,58 @@ def calculate_threat_level(findings: List[Dict]) -> str:
         return 'low'
 
 
+# Detectors in the order their findings are reported
+DETECTORS = [
+    detect_unicode_threats,
+    detect_instruction_patterns,
+    detect_base64_payloads,
+    detect_hex_payloads,
+    detect_rot13_payloads,
+    detect_delimiter_injection,
+]
+
+# Detectors that accept a shared fold_case() copy of the text
+LOWERCASE_DETECTORS = {detect_instruction_patterns, detect_rot13_payloads, detect_delimiter_injection}
+
+
+def _detector_results(text: str, detectors: List):
+    """Yield each detector's findings in turn"""
+    text_lower = None
+    for detector in detectors:
+        if detector in LOWERCASE_DETECTORS:
+            # One lowercased copy shared by the case-insensitive detectors
+            if text_lower is None:
+                text_lower = fold_case(text)
+            yield detector(text, text_lower)
+        else:
+            yield detector(text)
+
+
+def run_detectors(text: str, detectors: List = DETECTORS) -> List[Dict]:
+    """
+    Run detectors over text and combine their findings into one list.
+    This is CPU-bound; async callers should run it off the event loop.
+    """
+    return list(chain.from_iterable(_detector_results(text, detectors)))
+
+
 # ============================================
 # PYDANTIC MODELS
 # ============================================
 
+MAX_TEXT_LENGTH = 100000
+
+# Largest request body that can still hold a valid TextInput: JSON may spend up
+# to 12 bytes on one character (a \uXXXX\uXXXX surrogate pair), plus some slack
+# for the surrounding object
+MAX_BODY_BYTES = 12 * MAX_TEXT_LENGTH + 1024
+
 class TextInput(BaseModel):
-    text: str = Field(..., min_length=1, max_length=100000)
+    text: str = Field(..., min_length=1, max_length=MAX_TEXT_LENGTH)
 
 class ScanResult(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     original_text_length: int
@@ -770,6 +1187,8 @@ class ScanResult(BaseModel):
     summary: Dict
 
 class CleanResult(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     original_length: int
@@ -793,6 +1212,125 @@ class TechniqueInfo(BaseModel):
     examples: List[str]
 
 
+# ============================================
+# SCAN HISTORY WRITER
+# ============================================
+
+class ScanHistoryBuffer:
+    """
+    Coalesces scan history documents and writes them with insert_many.
+    A batch is flushed once MAX_ROWS documents are buffered or MAX_WAIT_MS
+    after its first document arrived, whichever comes first. Writes run as
+    their own tasks so buffering continues while a batch is in flight, but
+    at most MAX_CONCURRENT_WRITES at once: beyond that the flusher waits, and
+    a slow database backs up into the bounded queue.
+    """
+    MAX_WAIT_MS = 200
+    MAX_ROWS = 500
+    MAX_CONCURRENT_WRITES = 4
+    
+    # Queued in place of a document to make the flusher exit
+    _STOP = object()
+    
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        # Created in start(): asyncio primitives bind to the loop that first
+        # waits on them, and each app lifespan may run on a new loop
+        self.queue: Optional[asyncio.Queue] = None
+        self.write_slots: Optional[asyncio.Semaphore] = None
+        self.task: Optional[asyncio.Task] = None
+        # In-flight writes, referenced here so they aren't garbage collected
+        self.pending: set = set()
+    
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self.write_slots = asyncio.Semaphore(self.MAX_CONCURRENT_WRITES)
+        self.task = asyncio.create_task(self._flusher())
+    
+    def put_nowait(self, doc: Dict):
+        """Buffer a document without waiting; history is dropped if the buffer is full"""
+        if self.queue is None:
+            logger.warning("Scan history writer not started, dropping scan %s", doc.get('id'))
+            return
+        try:
+            self.queue.put_nowait(doc)
+        except asyncio.QueueFull:
+            logger.warning("Scan history buffer full, dropping scan %s", doc.get('id'))
+    
+    async def flush(self):
+        """Write everything buffered so far and wait until it is stored"""
+        if self.task is not None:
+            if self.task.done():
+                raise RuntimeError("Scan history writer is not running")
+            # A future in the queue makes the flusher hand off its current
+            # batch and resolve the future
+            handed_off = asyncio.get_running_loop().create_future()
+            await self.queue.put(handed_off)
+            await handed_off
+        await asyncio.gather(*self.pending, return_exceptions=True)
+    
+    async def drain(self):
+        """Write everything buffered so far and stop the flusher"""
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        if not task.done():
+            await self.queue.put(self._STOP)
+        # Waited on rather than awaited so a failed writer can't stop shutdown
+        await asyncio.wait([task])
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Scan history writer failed", exc_info=task.exception())
+        await asyncio.gather(*self.pending, return_exceptions=True)
+        self.queue = None
+    
+    async def _flush(self, batch: List[Dict]):
+        try:
+            # Unordered so one bad document doesn't fail the rest of the batch
+            await db.scan_history.insert_many(batch, ordered=False)
+        except Exception:
+            logger.exception("Failed to write %d scan history documents", len(batch))
+        finally:
+            self.write_slots.release()
+    
+    async def _flush_in_background(self, batch: List[Dict]):
+        await self.write_slots.acquire()
+        task = asyncio.create_task(self._flush(batch))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+    
+    async def _flusher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            control = None  # _STOP or a flush() future that ended the batch
+            doc = await self.queue.get()
+            deadline = loop.time() + self.MAX_WAIT_MS / 1000
+            
+            while True:
+                if not isinstance(doc, dict):
+                    control = doc
+                    break
+                batch.append(doc)
+                timeout = deadline - loop.time()
+                if len(batch) >= self.MAX_ROWS or timeout <= 0:
+                    break
+                try:
+                    doc = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            
+            if batch:
+                await self._flush_in_background(batch)
+            if control is self._STOP:
+                return
+            # The flush() waiting on it may have been cancelled
+            if control is not None and not control.done():
+                control.set_result(None)
+
+
+history_buffer = ScanHistoryBuffer()
+
+
 # ============================================
 # API ROUTES
 # ============================================
@@ -806,43 +1344,24 @@ async def root():
 async def scan_text(input: TextInput):
     """Scan text for prompt injection threats"""
     text = input.text
+    text_length = len(text)
     
-    # Run all detectors
-    findings = []
-    findings.extend(detect_zero_width_chars(text))
-    findings.extend(detect_bidi_chars(text))
-    findings.extend(detect_homoglyphs(text))
-    findings.extend(detect_control_chars(text))
-    findings.extend(detect_tag_chars(text))
-    findings.extend(detect_instruction_patterns(text))
-    findings.extend(detect_base64_payloads(text))
-    findings.extend(detect_hex_payloads(text))
-    findings.extend(detect_rot13_payloads(text))
-    findings.extend(detect_delimiter_injection(text))
-    
-    threat_level = calculate_threat_level(findings)
-    
-    # Create summary by type
-    summary = {}
-    for finding in findings:
-        ftype = finding['type']
-        if ftype not in summary:
-            summary[ftype] = {'count': 0, 'severity': finding.get('severity', 'unknown')}
-        summary[ftype]['count'] += finding.get('count', 1)
+    # Run all detectors in a worker thread so the event loop stays free
+    findings, threat_level, summary = await asyncio.to_thread(compute_scan, text)
     
     result = ScanResult(
-        original_text_length=len(text),
+        original_text_length=text_length,
         threat_level=threat_level,
         total_findings=len(findings),
         findings=findings,
         summary=summary
     )
     
-    # Store in database
-    await db.scan_history.insert_one({
+    # Buffer for the background history writer; returns immediately
+    history_buffer.put_nowait({
         'id': result.id,
         'timestamp': result.timestamp,
-        'original_text_preview': text[:100] + '...' if len(text) > 100 else text,
+        'original_text_preview': text[:100] + ('...' if text_length > 100 else ''),
         'threat_level': result.threat_level,
         'total_findings': result.total_findings,
         'findings': result.findings,
@@ -857,19 +1376,11 @@ async def clean_text_endpoint(input: TextInput):
     """Clean text by removing all detected threats"""
     text = input.text
     
-    # First scan to get threat level
-    findings = []
-    findings.extend(detect_zero_width_chars(text))
-    findings.extend(detect_bidi_chars(text))
-    findings.extend(detect_homoglyphs(text))
-    findings.extend(detect_control_chars(text))
-    findings.extend(detect_tag_chars(text))
+    # Scan for the threat level and clean the text in one worker thread
+    findings, clean_result = await asyncio.to_thread(scan_and_clean, text)
     
     threat_level_before = calculate_threat_level(findings)
     
-    # Clean the text
-    clean_result = clean_text(text)
-    
     result = CleanResult(
         original_length=clean_result['original_length'],
         cleaned_length=clean_result['cleaned_length'],
@@ -882,96 +1393,170 @@ async def clean_text_endpoint(input: TextInput):
     return result
 
 
+# Only the fields ScanHistory needs, so full findings aren't sent over the wire
+# and each document can be serialized as it comes back
+HISTORY_PROJECTION = {
+    '_id': 0, 'id': 1, 'timestamp': 1, 'original_text_preview': 1, 'threat_level': 1, 'total_findings': 1
+}
+
+
 @api_router.get("/history", response_model=List[ScanHistory])
-async def get_scan_history(limit: int = 20):
-    """Get scan history"""
-    history = await db.scan_history.find().sort('timestamp', -1).limit(limit).to_list(limit)
-    return [
-        ScanHistory(
-            id=h['id'],
-            timestamp=h['timestamp'],
-            original_text_preview=h['original_text_preview'],
-            threat_level=h['threat_level'],
-            total_findings=h['total_findings']
-        )
-        for h in history
-    ]
+async def get_scan_history(limit: int = Query(20, ge=1)):
+    """Get scan history, streamed from the cursor as a JSON array"""
+    cursor = db.scan_history.find({}, HISTORY_PROJECTION).sort('timestamp', -1).limit(limit)
+    docs = aiter(cursor)
+    # Fetch the first document before the response starts, so database
+    # errors still surface as an error status rather than a truncated 200
+    first = await anext(docs, None)
+    
+    async def generate():
+        yield b'['
+        if first is not None:
+            yield orjson.dumps(first)
+            async for h in docs:
+                yield b','
+                yield orjson.dumps(h)
+        yield b']'
+    
+    return StreamingResponse(generate(), media_type="application/json")
+
+
+# The techniques list is static, so it is serialized once at import
+TECHNIQUES = [
+    TechniqueInfo(
+        name="Zero-Width Characters",
+        description="Invisible Unicode characters that can hide malicious payloads. Common in ASCII smuggling attacks.",
+        severity="high",
+        examples=["U+200B (ZWSP)", "U+200C (ZWNJ)", "U+200D (ZWJ)", "U+FEFF (BOM)"]
+    ),
+    TechniqueInfo(
+        name="Bidirectional Overrides",
+        description="Unicode characters that change text direction, used to visually hide malicious content.",
+        severity="high",
+        examples=["U+202E (RLO)", "U+202D (LRO)", "U+2066-2069 (Isolates)"]
+    ),
+    TechniqueInfo(
+        name="Homoglyphs",
+        description="Characters from different scripts that look identical to Latin letters. Used to bypass filters.",
+        severity="medium",
+        examples=["Cyrillic 'а' vs Latin 'a'", "Greek 'ο' vs Latin 'o'"]
+    ),
+    TechniqueInfo(
+        name="Control Characters",
+        description="ASCII and Unicode control characters that can disrupt processing.",
+        severity="high",
+        examples=["NULL (U+0000)", "Escape (U+001B)", "Delete (U+007F)"]
+    ),
+    TechniqueInfo(
+        name="ASCII Smuggling (Tag Chars)",
+        description="Unicode tag characters (U+E0000-E007F) used to encode hidden ASCII messages.",
+        severity="critical",
+        examples=["Tag characters encode entire hidden prompts"]
+    ),
+    TechniqueInfo(
+        name="Instruction Injection",
+        description="Text patterns attempting to override system instructions.",
+        severity="high",
+        examples=["'Ignore previous instructions'", "'New system prompt'", "'You are now...'"]
+    ),
+    TechniqueInfo(
+        name="Base64 Payloads",
+        description="Encoded content that may contain hidden instructions.",
+        severity="high",
+        examples=["Base64 encoded override commands"]
+    ),
+    TechniqueInfo(
+        name="Delimiter Injection",
+        description="Attempts to break out of prompts using common delimiters.",
+        severity="medium",
+        examples=["```code blocks```", "[INST] markers", "### separators"]
+    ),
+]
+TECHNIQUES_JSON = json.dumps(
+    [t.model_dump() for t in TECHNIQUES], ensure_ascii=False, separators=(',', ':')
+).encode('utf-8')
+TECHNIQUES_HEADERS = {
+    'ETag': '"%s"' % hashlib.sha256(TECHNIQUES_JSON).hexdigest()[:32],
+    'Cache-Control': 'public, max-age=3600',
+}
 
 
 @api_router.get("/techniques", response_model=List[TechniqueInfo])
-async def get_techniques():
+async def get_techniques(request: Request):
     """Get list of detection techniques"""
-    return [
-        TechniqueInfo(
-            name="Zero-Width Characters",
-            description="Invisible Unicode characters that can hide malicious payloads. Common in ASCII smuggling attacks.",
-            severity="high",
-            examples=["U+200B (ZWSP)", "U+200C (ZWNJ)", "U+200D (ZWJ)", "U+FEFF (BOM)"]
-        ),
-        TechniqueInfo(
-            name="Bidirectional Overrides",
-            description="Unicode characters that change text direction, used to visually hide malicious content.",
-            severity="high",
-            examples=["U+202E (RLO)", "U+202D (LRO)", "U+2066-2069 (Isolates)"]
-        ),
-        TechniqueInfo(
-            name="Homoglyphs",
-            description="Characters from different scripts that look identical to Latin letters. Used to bypass filters.",
-            severity="medium",
-            examples=["Cyrillic 'а' vs Latin 'a'", "Greek 'ο' vs Latin 'o'"]
-        ),
-        TechniqueInfo(
-            name="Control Characters",
-            description="ASCII and Unicode control characters that can disrupt processing.",
-            severity="high",
-            examples=["NULL (U+0000)", "Escape (U+001B)", "Delete (U+007F)"]
-        ),
-        TechniqueInfo(
-            name="ASCII Smuggling (Tag Chars)",
-            description="Unicode tag characters (U+E0000-E007F) used to encode hidden ASCII messages.",
-            severity="critical",
-            examples=["Tag characters encode entire hidden prompts"]
-        ),
-        TechniqueInfo(
-            name="Instruction Injection",
-            description="Text patterns attempting to override system instructions.",
-            severity="high",
-            examples=["'Ignore previous instructions'", "'New system prompt'", "'You are now...'"]
-        ),
-        TechniqueInfo(
-            name="Base64 Payloads",
-            description="Encoded content that may contain hidden instructions.",
-            severity="high",
-            examples=["Base64 encoded override commands"]
-        ),
-        TechniqueInfo(
-            name="Delimiter Injection",
-            description="Attempts to break out of prompts using common delimiters.",
-            severity="medium",
-            examples=["```code blocks```", "[INST] markers", "### separators"]
-        ),
-    ]
+    if request.headers.get('if-none-match') == TECHNIQUES_HEADERS['ETag']:
+        return Response(status_code=304, headers=TECHNIQUES_HEADERS)
+    return Response(content=TECHNIQUES_JSON, media_type="application/json", headers=TECHNIQUES_HEADERS)
 
 
 @api_router.delete("/history")
 async def clear_history():
     """Clear all scan history"""
+    # Write out buffered scans first so they can't reappear after the clear
+    await history_buffer.flush()
     result = await db.scan_history.delete_many({})
     return {"deleted_count": result.deleted_count}
 
 
-# Include the router in the main app
-app.include_router(api_router)
-
+class BodySizeLimitMiddleware:
+    """
+    Reject bodies too large for any valid request before they are read and parsed.
+    Plain ASGI so it only costs a header lookup per request.
+    """
+    
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            for name, value in scope['headers']:
+                if name == b'content-length':
+                    if value.isdigit() and int(value) > self.max_bytes:
+                        response = ORJSONResponse(status_code=413, content={"detail": "Request body too large"})
+                        await response(scope, receive, send)
+                        return
+                    break
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=MAX_BODY_BYTES)
+
+# Added last so it wraps everything else, including the 413 above.
+# No credentials: the frontend sends none, and with them Starlette echoes
+# any Origin back with Allow-Credentials, so every site could make
+# cookie-bearing calls. Preflight responses are cached for a day.
 app.add_middleware(
     CORSMiddleware,
-    allow_credentials=True,
+    allow_credentials=False,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=86400,
 )
 
+# Include the router in the main app
+app.include_router(api_router)
+
+
+async def create_history_index():
+    # /history sorts newest first; create_index is a no-op if it already exists
+    try:
+        await db.scan_history.create_index([('timestamp', -1)])
+    except Exception:
+        logger.exception("Failed to create scan_history timestamp index")
+
+
+@app.on_event("startup")
+async def start_history_writer():
+    history_buffer.start()
+    # In the background so an unreachable database doesn't hold up startup
+    # for the server selection timeout; /scan doesn't need it
+    app.state.index_task = asyncio.create_task(create_history_index())
+
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.index_task.cancel()
+    await history_buffer.drain()
     client.close()
@@ -0,0 +1,147 @@
+"""
+API tests run against an in-memory stand-in for the scan_history collection.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, docs, projection):
+        self.docs = docs
+        self.projection = projection
+        self.count = None
+
+    def sort(self, key, direction):
+        self.docs = sorted(self.docs, key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    async def __aiter__(self):
+        fields = [field for field, include in self.projection.items() if include]
+        for doc in self.docs[:self.count or None]:
+            yield {field: doc[field] for field in fields if field in doc}
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        return FakeCursor(self.docs, projection)
+
+
+class FakeDatabase:
+    def __init__(self, docs=()):
+        self.scan_history = FakeCollection(list(docs))
+
+
+def history_doc(i):
+    return {
+        '_id': object(),
+        'id': f'scan-{i}',
+        'timestamp': f'2024-01-01T00:00:{i:02d}',
+        'original_text_preview': f'text {i}',
+        'threat_level': 'safe',
+        'total_findings': 0,
+        'findings': [{'type': 'large'}],
+    }
+
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDatabase(history_doc(i) for i in range(30))
+        patcher = mock.patch.object(server, 'db', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(server.app)
+
+    def test_history_streams_newest_first(self):
+        response = self.client.get('/api/history', params={'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        self.assertEqual(response.json(), [
+            {'id': f'scan-{i}', 'timestamp': f'2024-01-01T00:00:{i:02d}', 'original_text_preview': f'text {i}',
+             'threat_level': 'safe', 'total_findings': 0}
+            for i in (29, 28, 27)
+        ])
+
+    def test_history_default_limit(self):
+        self.assertEqual(len(self.client.get('/api/history').json()), 20)
+
+    def test_history_large_limit(self):
+        response = self.client.get('/api/history', params={'limit': 5000})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 30)
+
+    def test_history_empty(self):
+        self.db.scan_history.docs = []
+        response = self.client.get('/api/history')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_history_rejects_non_positive_limit(self):
+        for limit in (0, -1):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.client.get('/api/history', params={'limit': limit}).status_code, 422)
+
+
+class BodySizeLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(server.app)
+
+    def test_oversized_body_rejected(self):
+        body = b'{"text": "' + b'a' * server.MAX_BODY_BYTES + b'"}'
+        response = self.client.post('/api/scan', content=body, headers={
+            'Content-Type': 'application/json', 'Origin': 'https://example.com'})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json(), {'detail': 'Request body too large'})
+        # CORS is the outer layer, so the browser can read the rejection
+        self.assertEqual(response.headers['access-control-allow-origin'], '*')
+
+    def test_body_within_limit_accepted(self):
+        response = self.client.post('/api/scan', json={'text': 'hello world'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['threat_level'], 'safe')
+
+
+
+class TechniquesTest(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(server.app)
+
+    def test_techniques_carry_etag(self):
+        response = self.client.get('/api/techniques')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['etag'], server.TECHNIQUES_HEADERS['ETag'])
+        self.assertEqual(response.headers['cache-control'], 'public, max-age=3600')
+        self.assertEqual(response.json(), [t.model_dump() for t in server.TECHNIQUES])
+
+    def test_matching_etag_not_modified(self):
+        etag = self.client.get('/api/techniques').headers['etag']
+        response = self.client.get('/api/techniques', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['etag'], etag)
+
+    def test_stale_etag_gets_full_response(self):
+        response = self.client.get('/api/techniques', headers={'If-None-Match': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, server.TECHNIQUES_JSON)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+"""
+Fuzz tests for the single-pass character scan.
+
+The detectors and clean_text() in backend/server.py share one scan with
+several fast paths (bytes-level ASCII counting, the numpy category table,
+str.replace vs translate stripping).  These tests compare them against the
+straightforward per-character implementations they replaced, on random
+mixed-script input either side of every threshold.
+"""
+
+import os
+import random
+import sys
+import unicodedata
+import unittest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import server  # noqa: E402
+
+
+def reference_char_findings(text, table, ftype, severity):
+    findings = []
+    for char, meta in table.items():
+        count = text.count(char)
+        if count > 0:
+            positions = [i for i, c in enumerate(text) if c == char]
+            finding = {
+                'type': ftype,
+                'character': repr(char) if ftype != 'homoglyph' else char,
+                'unicode': f'U+{ord(char):04X}',
+                'description': meta if ftype != 'homoglyph' else meta[1],
+                'count': count,
+                'positions': positions[:10],
+                'severity': severity
+            }
+            if ftype == 'homoglyph':
+                finding['looks_like'] = meta[0]
+            findings.append(finding)
+    return findings
+
+
+def reference_control_findings(text):
+    control_found = {}
+    for i, char in enumerate(text):
+        code = ord(char)
+        if (code < 32 and code not in [9, 10, 13]) or code == 127 or 0x80 <= code <= 0x9F:
+            data = control_found.setdefault(char, {'count': 0, 'positions': []})
+            data['count'] += 1
+            if len(data['positions']) < 10:
+                data['positions'].append(i)
+    return [{
+        'type': 'control_char',
+        'character': repr(char),
+        'unicode': f'U+{ord(char):04X}',
+        'description': f'Control character at codepoint {ord(char)}',
+        'count': data['count'],
+        'positions': data['positions'],
+        'severity': 'high'
+    } for char, data in control_found.items()]
+
+
+def reference_tag_findings(text):
+    found = [(i, ord(c)) for i, c in enumerate(text)
+             if server.TAG_CHAR_START <= ord(c) <= server.TAG_CHAR_END]
+    if not found:
+        return []
+    hidden = ''.join(chr(code - server.TAG_CHAR_START) if code > server.TAG_CHAR_START else ''
+                     for _, code in found)
+    return [{
+        'type': 'ascii_smuggling',
+        'description': 'Unicode tag characters detected (ASCII smuggling)',
+        'count': len(found),
+        'positions': [i for i, _ in found[:10]],
+        'hidden_content': hidden[:100] if hidden else None,
+        'severity': 'critical'
+    }]
+
+
+def reference_clean_text(text):
+    cleaned = text
+    removed = []
+    for char in server.ZERO_WIDTH_CHARS:
+        if char in cleaned:
+            removed.append({'type': 'zero_width', 'count': cleaned.count(char)})
+            cleaned = cleaned.replace(char, '')
+    for char in server.BIDI_CHARS:
+        if char in cleaned:
+            removed.append({'type': 'bidi', 'count': cleaned.count(char)})
+            cleaned = cleaned.replace(char, '')
+    homoglyph_count = 0
+    for char, (replacement, _) in server.HOMOGLYPHS.items():
+        if char in cleaned:
+            homoglyph_count += cleaned.count(char)
+            cleaned = cleaned.replace(char, replacement)
+    if homoglyph_count:
+        removed.append({'type': 'homoglyph', 'count': homoglyph_count})
+    kept = [c for c in cleaned if not server.is_control_code(ord(c))]
+    if len(kept) != len(cleaned):
+        removed.append({'type': 'control', 'count': len(cleaned) - len(kept)})
+    cleaned = ''.join(kept)
+    kept = [c for c in cleaned if not server.TAG_CHAR_START <= ord(c) <= server.TAG_CHAR_END]
+    if len(kept) != len(cleaned):
+        removed.append({'type': 'tag_chars', 'count': len(cleaned) - len(kept)})
+    cleaned = unicodedata.normalize('NFKC', ''.join(kept))
+    return {
+        'original_length': len(text),
+        'cleaned_length': len(cleaned),
+        'cleaned_text': cleaned,
+        'characters_removed': len(text) - len(cleaned),
+        'removed_details': removed
+    }
+
+
+SPECIAL_CHARS = (list(server.ZERO_WIDTH_CHARS) + list(server.BIDI_CHARS) + list(server.HOMOGLYPHS) +
+                 ['\x00', '\x01', '\x1f', '\x7f', '\x80', '\x85', '\x9f', '\t', '\n', '\r',
+                  '\U000e0000', '\U000e0041', '\U000e007f', '\U000e0080', '\ud800'])
+PLAIN_CHARS = (list('abcdefghijklmnopqrstuvwxyz ABCXYZ0123456789.,!') +
+               list('éßΣжあ漢ﬁｆ€') + ['\U0001F600'])
+ASCII_CHARS = [chr(c) for c in range(128)]
+
+
+def random_text(rng, alphabet, length):
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+def fuzz_corpus(seed=0):
+    rng = random.Random(seed)
+    threshold = server.NUMPY_SCAN_MIN_LENGTH
+    lengths = [0, 1, 2, 31, 32, 33, 100,
+               threshold - 1, threshold, threshold + 1, 3 * threshold]
+    corpus = []
+    for length in lengths:
+        for density in (0.0, 0.01, 0.2, 0.9):
+            for _ in range(6):
+                corpus.append(''.join(
+                    rng.choice(SPECIAL_CHARS) if rng.random() < density else rng.choice(PLAIN_CHARS)
+                    for _ in range(length)))
+            corpus.append(random_text(rng, ASCII_CHARS, length))
+            corpus.append(random_text(rng, PLAIN_CHARS, length))
+    # Enough distinct finds to cross MAX_REPLACE_CHARS
+    corpus.append(''.join(SPECIAL_CHARS) * 3)
+    corpus.append('x' * threshold + ''.join(SPECIAL_CHARS))
+    return corpus
+
+
+class CharacterScanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = fuzz_corpus()
+
+    def test_detectors_match_reference(self):
+        for text in self.corpus:
+            with self.subTest(text=text[:40]):
+                server._scan.cache_clear()
+                self.assertEqual(server.detect_zero_width_chars(text),
+                                 reference_char_findings(text, server.ZERO_WIDTH_CHARS, 'zero_width', 'high'))
+                self.assertEqual(server.detect_bidi_chars(text),
+                                 reference_char_findings(text, server.BIDI_CHARS, 'bidi_override', 'high'))
+                self.assertEqual(server.detect_homoglyphs(text),
+                                 reference_char_findings(text, server.HOMOGLYPHS, 'homoglyph', 'medium'))
+                self.assertEqual(server.detect_control_chars(text), reference_control_findings(text))
+                self.assertEqual(server.detect_tag_chars(text), reference_tag_findings(text))
+
+    def test_clean_text_matches_reference(self):
+        for text in self.corpus:
+            with self.subTest(text=text[:40]):
+                self.assertEqual(server.clean_text(text), reference_clean_text(text))
+
+    def test_candidate_positions_cover_every_finding(self):
+        special = set(server.CHAR_META)
+        for text in self.corpus:
+            with self.subTest(text=text[:40]):
+                expected = [i for i, c in enumerate(text)
+                            if c in special or server.is_control_code(ord(c))
+                            or server.TAG_CHAR_START <= ord(c) <= server.TAG_CHAR_END]
+                found = [i for i in server._candidate_positions(text)
+                         if text[i] in special or server.is_control_code(ord(text[i]))
+                         or server.TAG_CHAR_START <= ord(text[i]) <= server.TAG_CHAR_END]
+                self.assertEqual(found, expected)
+
+    def test_strip_found_chars_matches_clean_table(self):
+        for text in self.corpus:
+            with self.subTest(text=text[:40]):
+                scan = server._scan(text)
+                self.assertEqual(server.strip_found_chars(text, scan), text.translate(server.CLEAN_TABLE))
+
+    def test_unicode_threats_match_reference(self):
+        # ASCII text takes a shortcut past the zero-width, bidi and tag detectors
+        corpus = self.corpus + [''.join(ASCII_CHARS) * n for n in (1, 10)]
+        for text in corpus:
+            with self.subTest(text=text[:40]):
+                expected = (reference_char_findings(text, server.ZERO_WIDTH_CHARS, 'zero_width', 'high') +
+                            reference_char_findings(text, server.BIDI_CHARS, 'bidi_override', 'high') +
+                            reference_char_findings(text, server.HOMOGLYPHS, 'homoglyph', 'medium') +
+                            reference_control_findings(text) +
+                            reference_tag_findings(text))
+                self.assertEqual(server.detect_unicode_threats(text), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Tests for the encoded-payload helpers: hex truncation and the keyword
+threat check on decoded content.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import server  # noqa: E402
+
+
+def hex_match(prefix, data, separator=''):
+    return separator.join(f'{prefix}{byte:02x}' for byte in data)
+
+
+class TruncateHexTest(unittest.TestCase):
+    def test_short_match_unchanged(self):
+        for decoder, prefix in server.HEX_DECODERS:
+            text = hex_match(prefix, b'ignore all')
+            self.assertEqual(server.truncate_hex(text, prefix, limit=len(text)), text)
+
+    def test_raw_hex_cut_to_even_length(self):
+        text = hex_match('', b'ignore previous')
+        self.assertEqual(server.truncate_hex(text, '', limit=11), text[:10])
+
+    def test_byte_ending_at_limit_kept(self):
+        text = hex_match('\\x', b'abcdefghij')
+        self.assertEqual(server.truncate_hex(text, '\\x', limit=12), '\\x61\\x62\\x63')
+
+    def test_cut_never_splits_a_byte(self):
+        rng = random.Random(0)
+        data = bytes(rng.randrange(0x20, 0x7f) for _ in range(200))
+        cases = [(hex_match(prefix, data, ', ' if prefix == '0x' else ''), decoder, prefix)
+                 for decoder, prefix in server.HEX_DECODERS]
+        for text, decoder, prefix in cases:
+            for limit in range(8, 120):
+                with self.subTest(prefix=prefix, limit=limit):
+                    cut = server.truncate_hex(text, prefix, limit=limit)
+                    self.assertLessEqual(len(cut), limit)
+                    self.assertTrue(text.startswith(cut))
+                    decoded = decoder(cut)
+                    self.assertEqual(decoded, data[:len(decoded)].decode())
+                    # The next whole byte would not have fit
+                    next_byte = text.find(prefix, len(cut)) if prefix else len(cut)
+                    self.assertGreater(next_byte + len(prefix) + 2, limit)
+
+
+class ThreatCheckTest(unittest.TestCase):
+    def test_keyword_prerequisites(self):
+        self.assertEqual(server.KEYWORD_PREREQUISITES['new prompt'], 'prompt')
+        self.assertEqual(server.KEYWORD_PREREQUISITES['execute'], 'exec')
+        self.assertEqual(server.KEYWORD_PREREQUISITES['api_key'], 'key')
+        self.assertIsNone(server.KEYWORD_PREREQUISITES['prompt'])
+
+    def test_keywords_match_plain_search(self):
+        rng = random.Random(0)
+        words = list(server.SUSPICIOUS_KEYWORDS) + ['hello', 'world', 'api', 'new', 'exe', 'k', 'ey']
+        for _ in range(500):
+            content = ' '.join(rng.choice(words) for _ in range(rng.randint(0, 6)))
+            folded = server.fold_case(content)
+            expected = [f"Contains '{keyword}'" for keyword in server.SUSPICIOUS_KEYWORDS if keyword in folded]
+            with self.subTest(content=content):
+                found = [t for t in server.check_content_for_threats(content) if t.startswith('Contains ')]
+                self.assertEqual(found, expected)
+
+    def test_dependent_keyword_reported_with_its_prerequisite(self):
+        threats = server.check_content_for_threats('please execute the new prompt')
+        for keyword in ('exec', 'execute', 'prompt', 'new prompt'):
+            self.assertIn(f"Contains '{keyword}'", threats)
+        self.assertNotIn("Contains 'api_key'", server.check_content_for_threats('no key here'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Tests for ScanHistoryBuffer against an in-memory stand-in for the
+scan_history collection.
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+from unittest import mock
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import server  # noqa: E402
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_many(self, docs, ordered=True):
+        await asyncio.sleep(0)
+        self.docs.extend(docs)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.scan_history = FakeCollection()
+
+
+class ScanHistoryBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDatabase()
+        patcher = mock.patch.object(server, 'db', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_flush_writes_buffered_documents(self):
+        async def run():
+            buffer = server.ScanHistoryBuffer()
+            buffer.start()
+            for i in range(3):
+                buffer.put_nowait({'id': i})
+            await buffer.flush()
+            self.assertEqual([doc['id'] for doc in self.db.scan_history.docs], [0, 1, 2])
+            await buffer.drain()
+
+        asyncio.run(run())
+
+    def test_cancelled_flush_leaves_writer_running(self):
+        async def run():
+            buffer = server.ScanHistoryBuffer()
+            buffer.start()
+            flush = asyncio.create_task(buffer.flush())
+            # Let flush() queue its future, then cancel it before the flusher
+            # gets to resolve it
+            await asyncio.sleep(0)
+            flush.cancel()
+            await asyncio.sleep(0.01)
+            self.assertFalse(buffer.task.done())
+
+            buffer.put_nowait({'id': 'after'})
+            await asyncio.wait_for(buffer.flush(), 1)
+            self.assertEqual(self.db.scan_history.docs, [{'id': 'after'}])
+            await asyncio.wait_for(buffer.drain(), 1)
+
+        asyncio.run(run())
+
+    def test_flush_fails_fast_when_writer_stopped(self):
+        async def run():
+            buffer = server.ScanHistoryBuffer()
+            buffer.start()
+            buffer.task.cancel()
+            await asyncio.sleep(0)
+            with self.assertRaises(RuntimeError):
+                await asyncio.wait_for(buffer.flush(), 1)
+            await asyncio.wait_for(buffer.drain(), 1)
+
+        asyncio.run(run())
+
+    def test_restart_on_new_event_loop(self):
+        buffer = server.ScanHistoryBuffer()
+
+        async def lifespan(doc_id):
+            buffer.start()
+            # Make the queue and semaphore wait on this loop
+            await asyncio.sleep(0.01)
+            buffer.put_nowait({'id': doc_id})
+            await buffer.drain()
+
+        asyncio.run(lifespan(1))
+        asyncio.run(lifespan(2))
+        self.assertEqual([doc['id'] for doc in self.db.scan_history.docs], [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()